@@ -1,4 +1,4 @@
-import functools
+import math
 import numpy as np
 
 import gymnasium
@@ -82,14 +82,8 @@ class nepiada(ParallelEnv):
         
         print("NEPIADA INFO: All Agents: ", str(self.possible_agents))
 
-    # lru_cache allows observation and action spaces to be memoized, reducing clock cycles required to get each agent's space.
-    @functools.lru_cache(maxsize=None)
-    def observation_space(self, agent):
-        """
-        This is the way the observations are structured for RLib. Eventually all the values are flattened internally.
-        Note that the order in which the observation is flattened is alphabetically in order of the key values.
-        """
-        return Dict(
+        # The observation and action spaces are identical for all agents, so one instance of each is shared
+        self._observation_space = Dict(
             {
                 "target_neighbours": Box(
                     low=-self.config.size, high=self.config.size, shape=(self.total_agents, 2), dtype=np.float32
@@ -105,12 +99,20 @@ class nepiada(ParallelEnv):
                 ),
             }
         )
+        self._action_space = Discrete(len(self.config.possible_moves))
+
+    def observation_space(self, agent):
+        """
+        This is the way the observations are structured for RLib. Eventually all the values are flattened internally.
+        Note that the order in which the observation is flattened is alphabetically in order of the key values.
+        The space is the same for every agent, so a single instance built in __init__ is shared.
+        """
+        return self._observation_space
 
     # Action space should be defined here.
-    @functools.lru_cache(maxsize=None)
     def action_space(self, agent):
         # Discrete movement, either up, down, stay, left or right.
-        return Discrete(len(self.config.possible_moves))
+        return self._action_space
 
     def render(self):
         """
@@ -130,9 +132,10 @@ class nepiada(ParallelEnv):
         """
         Observe should return the agents within the observation radius of the specified agent.
         Param: Unique agent string identifier: e.g. 'adversarial_0'
-        Return: An array of agents who's position it can directly observe
+        Return: An array of agents who's position it can directly observe, this array is cached and must not be modified.
+                The indices of these agents are available without a copy from self.world.graph.obs_neighbours(agent_name)
         """
-        return np.array(self.world.graph.obs[agent_name])
+        return self.world.graph.obs_array(agent_name)
 
     def close(self):
         """
@@ -275,15 +278,15 @@ class nepiada(ParallelEnv):
         """
         beliefs = {agent: None for agent in self.agents}
 
+        # The positions of all agents, the rows are in the same order as self.agents
+        positions = self.world.positions.astype(np.float32)
+
         # Get the actual position of agents within the observation radius
-        for agent_name in self.agents:
-            agent_beliefs = {}
-            for observed_agent_name in self.agents:
-                observed_agent = self.world.get_agent(observed_agent_name)
-                if (observed_agent_name == agent_name) or (observed_agent_name in self.world.graph.obs[agent_name]):
-                    agent_beliefs[observed_agent_name] = observed_agent.p_pos # Can be observed
-                else:
-                    agent_beliefs[observed_agent_name] = None  # Cannot be observed
+        for i, agent_name in enumerate(self.agents):
+            agent_beliefs = dict.fromkeys(self.agents)  # Cannot be observed
+            agent_beliefs[agent_name] = positions[i]
+            for j in self.world.graph.obs_neighbours(agent_name):
+                agent_beliefs[self.agents[j]] = positions[j] # Can be observed
             beliefs[agent_name] = agent_beliefs
 
         # Estimate the position of the remaining agents using comm graph
@@ -339,12 +342,10 @@ class nepiada(ParallelEnv):
 
         # RLib Observations
         observations = {agent: None for agent in self.agents}
-        for agent_name in self.agents:
+        for i, agent_name in enumerate(self.agents):
             observation = OrderedDict()
-            # Get the agent
-            curr_agent = self.world.get_agent(agent_name)
             # Write position of the agent in np array format
-            observation["agent_position"] = np.array(curr_agent.p_pos, dtype=np.float32)
+            observation["agent_position"] = positions[i]
 
             # True positions in np array format
             final_beliefs = []
@@ -380,16 +381,19 @@ class nepiada(ParallelEnv):
         observations[i][j][k] is the location that drone i is told by drone k where drone j is
         """
         incoming_all_messages = {}
+        graph = self.world.graph
         for agent_name in self.agents:
-            observation = self.world.graph.obs[agent_name]
+            # The graphs are looked up by index, which are in the same order as self.agents
+            observation = set(graph.obs_neighbours(agent_name).tolist())
+            helpful_agents = [self.agents[j] for j in graph.comm_neighbours(agent_name).tolist()]
             incoming_agent_messages = {}
 
-            for target_agent_name in self.agents:
+            for target_idx, target_agent_name in enumerate(self.agents):
                 incoming_communcation_messages = {}
 
-                if target_agent_name not in observation:
+                if target_idx not in observation:
                     # Must estimate where the agent is via communication
-                    for helpful_agent in self.world.graph.comm[agent_name]:
+                    for helpful_agent in helpful_agents:
                         curr_agent = self.world.get_agent(helpful_agent)
                         if curr_agent.type == AgentType.ADVERSARIAL:
                             helpful_beliefs = self.config.noise.add_noise(curr_agent.beliefs)
@@ -508,17 +512,20 @@ class nepiada(ParallelEnv):
                     agent.beliefs[target_agent_name] = np.array([np.random.randint(self.config.size), np.random.randint(self.config.size)], dtype=np.float32)
 
     def _reset_agent_pos(self):
-        for agent_name in self.agents:
-            self.world.get_agent(agent_name).p_pos = np.random.randint(low=0, high=Config.size, size=2)
+        # Written in place, since each agent's p_pos is a view into the world's positions
+        self.world.positions[:] = np.random.randint(low=0, high=Config.size, size=self.world.positions.shape)
 
-    def initialize_infos_with_agents(self):
+    def _update_infos_with_graphs(self):
+        graph = self.world.graph
         for agent_name in self.agents:
-            self.infos[agent_name]["agent_instance"] = self.world.get_agent(agent_name)
+            info = self.infos[agent_name]
+            info["obs"] = graph.obs[agent_name]
+            info["comm"] = graph.comm[agent_name]
 
     def _update_agents_pos(self):
         for agent in self.agents:
             latest_pos = self.world.get_agent(agent_name=agent).p_pos
-            self.agents_pos[agent]["p_pos"].append(latest_pos)
+            self.agents_pos[agent]["p_pos"].append(latest_pos.copy())
             self.agents_pos[agent]["target_dist"].append(
                 self.world.get_target_distance(latest_pos)
             )
@@ -592,7 +599,7 @@ class nepiada(ParallelEnv):
 
         # Reset the comm and observation graphs
         self.world.graph.reset_graphs()
-        self.world.graph.update_graphs(self.world.agents)
+        self.world.update_graphs()
 
         # Store prev scores in agent
         scores = self._compute_scores()
@@ -601,18 +608,21 @@ class nepiada(ParallelEnv):
         # Reset the rewards
         self.rewards = {agent: 0 for agent in self.agents}
 
-        # Reset the truncations
+        # Reset the terminations and truncations, these are updated in place at every step
+        self.terminations = {agent: False for agent in self.agents}
         self.truncations = {agent: False for agent in self.agents}
 
-        # Infos is used to pass aditional information
-        self.infos = {agent: {} for agent in self.agents}
-
-        # Store the target neighbours for each agent
-        self.obs_target_neighbours = self._set_obs_target_neighbours()
+        # Infos is used to pass aditional information, the dictionaries are allocated once here and updated in place at every step
+        self.infos = {agent: {"obs": None, "comm": None} for agent in self.agents}
 
         # Initialize the infos with the agent instances, so the algorithm can access agent beliefs.
         if (self.config.pass_agents_in_infos):
-            self.initialize_infos_with_agents()
+            for agent_name in self.agents:
+                self.infos[agent_name]["agent_instance"] = self.world.get_agent(agent_name)
+        self._update_infos_with_graphs()
+
+        # Store the target neighbours for each agent
+        self.obs_target_neighbours = self._set_obs_target_neighbours()
 
         # For incomming messages
         self.incoming_msgs = {agent: {} for agent in self.agents}
@@ -650,16 +660,22 @@ class nepiada(ParallelEnv):
 
         - infos
             Is a dictionary with agent_names as the key. Each value in turn is a dict
-            of the form {"comm": [], "beliefs": [], "incoming_all_messages": []}
+            of the form {"obs": [], "comm": [], "agent_instance": Agent}
+            To access a agent's observation graph: infos[agent_name]["obs"]
             To access a agent's communcation graph: infos[agent_name]["comm"]
-            To access a agent's incoming_all_messages dictionary: infos[agent_name]["incoming_all_messages"]
+            The agent instance is only included if config.pass_agents_in_infos is set
 
+        Note that the rewards, terminations, truncations and infos dictionaries are allocated once in reset,
+        and the same objects are returned and overwritten in place by every step. Callers of the raw env that hold
+        on to them across steps, e.g. to record a trajectory, must copy them first: rewards = dict(rewards).
+        The same holds for the per agent dicts in infos and their obs and comm lists, which are refilled in place.
+        The parallel_env wrapper returns new outer dictionaries, but passes the per agent info dicts through.
         """
         # Assert that number of actions are equal to the number of agents
         assert len(actions) == len(self.agents)
 
         # Update drone positions
-        self.move_drones(actions)
+        any_moved = bool(self.move_drones(actions).any())
 
         # Update the running lists keeping track of positions
         self._update_agents_pos()
@@ -668,23 +684,19 @@ class nepiada(ParallelEnv):
         # TODO: Account for large negative rewards for collision or off-boundary moves
         self.rewards = self.get_rewards()
 
-        terminations = {agent: False for agent in self.agents}
         self.num_moves += 1
         env_truncation = self.num_moves >= self.config.iterations
-        truncations = {agent: env_truncation for agent in self.agents}
+        for agent in self.agents:
+            self.terminations[agent] = False
+            self.truncations[agent] = env_truncation
 
-        # Update the observation and communication graphs at each iteration
-        self.world.update_graphs()
-        
-        # For incomming messages
-        self.incoming_msgs = {agent: {} for agent in self.agents}
+        # Update the observation and communication graphs at each iteration, if any drone has moved
+        self.world.update_graphs(moved=any_moved)
 
         # Info will be used to pass information about comm graphs, beliefs, and incoming messages
-        # self.infos = {agent_name: {} for agent_name in self.agents}
-        
-        # For incomming messages
-        self.incoming_msgs = {agent: {} for agent in self.agents}
+        self._update_infos_with_graphs()
 
+        # For incomming messages, the dictionary allocated in reset is reused
         incoming_all_messages, trustworthy_agents = self.get_all_messages()
         for agent_name in self.agents: 
             self.incoming_msgs[agent_name] = incoming_all_messages[agent_name]
@@ -694,36 +706,42 @@ class nepiada(ParallelEnv):
         #     self.render()
 
         self.observations = self.get_observations(self.incoming_msgs, trustworthy_agents)
-        return self.observations, self.rewards, terminations, truncations, self.infos
+        return self.observations, self.rewards, self.terminations, self.truncations, self.infos
 
     def move_drones(self, actions):
         """
-        Move the drones according to the actions
+        Move the drones according to the actions. All drones are moved at once using the move lookup table,
+        moves that would take a drone outside the grid are ignored. Drones are allowed to occupy the same position.
+        Returns a boolean array, in the order of self.agents, that is true for the drones that moved.
         """
-        # Drones that collided with another drone, for reprocessing
-        collided_drones = []
+        agents = [self.world.agents[agent_name] for agent_name in self.agents]
+        action_vec = np.fromiter(
+            (actions[agent_name] for agent_name in self.agents), dtype=np.int64, count=len(agents)
+        )
 
-        for agent_name in self.agents:
-            agent = self.world.agents[agent_name]
-            action = actions[agent_name]
-            status = self.world.grid.move_drone(agent, action)
-            if status == -2:
-                collided_drones.append(agent_name)
-            elif status == -1:
-                # Drone collided with boundary
-                # THANOS EXPERIMENTAL - Large negative reward will be given on instance.
-                #self.world.agents[agent_name].prev_score = -self.world.agents[agent_name].prev_score
-                pass
-
-        if collided_drones:
-            assert (
-                False
-            ), "We should be allowing for multiple drones to occupy the same position"
+        # Indexing the lookup table would silently wrap negative actions, so they are checked first
+        move_deltas = self.world.grid.move_deltas
+        assert ((action_vec >= 0) & (action_vec < len(move_deltas))).all(), "Invalid action"
+
+        # The rows of the world's positions are in the same order as self.agents
+        pos = self.world.positions
+        new_pos = pos + move_deltas[action_vec]
+
+        # A drone that collides with the boundary stays where it is
+        # THANOS EXPERIMENTAL - Large negative reward could be given on instance.
+        valid = ((new_pos >= 0) & (new_pos < self.config.size)).all(axis=1)
+        moved = valid & (new_pos != pos).any(axis=1)
+
+        for i in np.flatnonzero(moved):
+            self.world.grid.place_drone(agents[i], new_pos[i, 0], new_pos[i, 1])
+
+        return moved
 
     ## THANOS EXPERIMENTAL
     ## Rewards - Default
     def get_rewards(self):
-        rewards = {}
+        # The rewards dictionary allocated in reset is updated in place
+        rewards = self.rewards
         curr_scores = self._compute_scores()
 
         for agent_name in self.agents:
@@ -742,7 +760,7 @@ class nepiada(ParallelEnv):
 
     ## THANOS EXPERIMENTAL
     def get_rewards_no_delta(self):
-        rewards = {}
+        rewards = self.rewards
         curr_scores = self._compute_scores()
     
         values = curr_scores.values()
@@ -803,25 +821,23 @@ class nepiada(ParallelEnv):
         # We update the global arrangement vector in the graph to visually inspect the global centroid of the agents
         self.world.graph.global_arrangement_vector = global_arrangement_vector
 
+        # Unpack every position into python scalars once, so the distances below use plain float math instead of NumPy scalars
+        positions = self._scalar_positions()
+
         # Add each agents reward based on their target neighbours
         for agent_name in self.agents:
             agent = self.world.agents[agent_name]
-            agent_x = agent.p_pos[0]
-            agent_y = agent.p_pos[1]
+            agent_x, agent_y = positions[agent_name]
             deviation_from_arrangement = 0
-            deviation_from_global_arrangement = np.sqrt((agent_x - target_x) ** 2 + (target_y - agent_y) ** 2)
+            dx = agent_x - target_x
+            dy = target_y - agent_y
+            deviation_from_global_arrangement = math.sqrt(dx * dx + dy * dy)
 
-            for neighbour_name, ideal_distance in agent.target_neighbour.items():
-                neighbour = self.world.agents[neighbour_name]
-                neighbour_x = neighbour.p_pos[0]
-                neighbour_y = neighbour.p_pos[1]
-                ideal_x = ideal_distance[0]
-                ideal_y = ideal_distance[1]
-
-                deviation_from_arrangement += np.sqrt(
-                    (neighbour_x - agent_x - ideal_x) ** 2
-                    + (neighbour_y - agent_y - ideal_y) ** 2
-                )
+            for neighbour_name, (ideal_x, ideal_y) in agent.target_neighbour.items():
+                neighbour_x, neighbour_y = positions[neighbour_name]
+                dx = neighbour_x - agent_x - ideal_x
+                dy = neighbour_y - agent_y - ideal_y
+                deviation_from_arrangement += math.sqrt(dx * dx + dy * dy)
 
             # THANOS EXPERIMENTAL - Normalize the deviation from arrangement
             deviation_from_arrangement = deviation_from_arrangement / len(agent.target_neighbour)
@@ -857,28 +873,30 @@ class nepiada(ParallelEnv):
         # We update the global arrangement vector in the graph to visually inspect the global centroid of the agents
         self.world.graph.global_arrangement_vector = global_arrangement_vector
 
+        positions = self._scalar_positions()
+
         # Add each agents reward based on their target neighbours
         for agent_name in self.agents:
             agent = self.world.agents[agent_name]
-            agent_x = agent.p_pos[0]
-            agent_y = agent.p_pos[1]
+            agent_x, agent_y = positions[agent_name]
             deviation_from_arrangement = 0
-            for neighbour_name, ideal_distance in agent.target_neighbour.items():
-                neighbour = self.world.agents[neighbour_name]
-                neighbour_x = neighbour.p_pos[0]
-                neighbour_y = neighbour.p_pos[1]
-                ideal_x = ideal_distance[0]
-                ideal_y = ideal_distance[1]
-
-                deviation_from_arrangement += np.sqrt(
-                    (neighbour_x - agent_x - ideal_x) ** 2
-                    + (neighbour_y - agent_y - ideal_y) ** 2
-                )
+            for neighbour_name, (ideal_x, ideal_y) in agent.target_neighbour.items():
+                neighbour_x, neighbour_y = positions[neighbour_name]
+                dx = neighbour_x - agent_x - ideal_x
+                dy = neighbour_y - agent_y - ideal_y
+                deviation_from_arrangement += math.sqrt(dx * dx + dy * dy)
 
             scores[agent_name] = -((self.config.global_reward_weight * global_arrangement_reward) + (self.config.local_reward_weight * deviation_from_arrangement))
             
         return scores
 
+    def _scalar_positions(self):
+        """
+        Returns a dictionary of agent_name to the (x, y) position of the agent as python scalars.
+        The rows of the world's positions are in the same order as self.agents, so they are unpacked in one call.
+        """
+        return dict(zip(self.agents, map(tuple, self.world.positions.tolist())))
+
     def _store_scores_in_agent(self, scores):
         for agent_name in self.agents:
             self.world.agents[agent_name].prev_score = scores[agent_name]
@@ -0,0 +1,181 @@
+import numpy as np
+
+from utils.config import Config
+from utils.grid import build_move_deltas
+from utils.world import agent_name, target_neighbours
+from utils.graph_kernels import build_adj_batch, build_adj_min_batch
+
+
+class VectorEnv:
+    """
+    Steps a batch of independent nepiada grids in a single pass, for collecting many rollouts at once.
+
+    All the state is held in arrays with a leading environment axis, e.g. the agent positions are an (E, N, 2) array,
+    so a step across every environment is a handful of NumPy operations and one call to the batched graph kernels.
+
+    Only the physical part of the environment is simulated: the agent positions, the observation and communication
+    graphs, and the rewards. Beliefs, message passing and the k-means pruning are per-agent and remain in nepiada.
+    Agents are indexed in the same order as nepiada, adversarial agents first followed by truthful agents.
+    """
+
+    def __init__(self, config: Config = Config()):
+        self.config = config
+        self.num_agents = config.num_good_agents + config.num_adversarial_agents
+        self.num_envs = 0
+
+        assert self.num_agents == config.agent_grid_width * config.agent_grid_height
+
+        self.possible_agents = [agent_name(i, config) for i in range(self.num_agents)]
+
+        # Lookup table from an action to its (dx, dy) move, the same table as Grid.move_deltas
+        self.move_table = build_move_deltas(config.possible_moves)
+
+        self._obs_r2 = config.obs_radius**2
+        self._comm_r2 = config.dynamic_comms_radius**2
+
+        self._init_target_neighbours()
+        self._rng = np.random.RandomState(config.seed)
+
+    def _init_target_neighbours(self):
+        """
+        The target neighbours for each agent are the same as in World.
+        They are stored as an (N, 4) array of neighbour indices, an (N, 4, 2) array of ideal relative positions
+        and an (N, 4) mask of which of the four neighbours exist.
+        """
+        width = self.config.agent_grid_width
+        height = self.config.agent_grid_height
+
+        self.target_neighbours = np.zeros((self.num_agents, 4), dtype=np.int32)
+        self.target_offsets = np.zeros((self.num_agents, 4, 2), dtype=np.float32)
+        self.target_mask = np.zeros((self.num_agents, 4), dtype=bool)
+
+        for i in range(self.num_agents):
+            for k, (neighbour, offset) in enumerate(target_neighbours(i, width, height)):
+                self.target_neighbours[i, k] = neighbour
+                self.target_offsets[i, k] = offset
+                self.target_mask[i, k] = True
+
+    def _update_graphs(self):
+        """
+        Rebuilds the observation and communication graphs of every environment.
+        Both graphs are stored as a CSR over E * N rows, see build_adj_min_batch for the layout.
+        """
+        if self.config.dynamic_obs:
+            self.obs_indptr, self.obs_indices = build_adj_batch(self.pos, self._obs_r2)
+
+        if self.config.dynamic_comms:
+            self.comm_indptr, self.comm_indices = build_adj_min_batch(
+                self.pos, self._comm_r2, self.config.dynamic_comms_enforce_minimum
+            )
+
+    def _reset_graphs(self):
+        rows = self.num_envs * self.num_agents
+
+        # A static observation graph is empty
+        self.obs_indptr = np.zeros(rows + 1, dtype=np.int32)
+        self.obs_indices = np.zeros(0, dtype=np.int32)
+
+        # A static communication graph allows every agent to communicate with all agents
+        self.comm_indptr = np.arange(rows + 1, dtype=np.int32) * self.num_agents
+        self.comm_indices = np.tile(np.arange(self.num_agents, dtype=np.int32), rows)
+
+    def _compute_scores(self):
+        """
+        Compute the scores of the agents based on their distance from the target and their target neighbours, as in nepiada.
+        Returns an (E, N) array of scores.
+        """
+        target = self.config.size / 2
+        pos = self.pos.astype(np.float32)
+
+        deviation_from_global_arrangement = np.sqrt(
+            (pos[..., 0] - target) ** 2 + (target - pos[..., 1]) ** 2
+        )
+
+        # (E, N, 4, 2) deviation of every target neighbour from its ideal relative position
+        deviation = pos[:, self.target_neighbours, :] - pos[:, :, None, :] - self.target_offsets
+        deviation = np.sqrt((deviation**2).sum(axis=-1)) * self.target_mask
+        deviation_from_arrangement = deviation.sum(axis=-1) / self.target_mask.sum(axis=-1)
+
+        return -(
+            (self.config.global_reward_weight * deviation_from_global_arrangement)
+            + (self.config.local_reward_weight * deviation_from_arrangement)
+        )
+
+    def neighbours(self, env, agent, graph="obs"):
+        """
+        Returns the indices of the agents in the observation or communication graph of an agent in a particular environment.
+        """
+        if graph == "obs":
+            indptr, indices = self.obs_indptr, self.obs_indices
+        elif graph == "comm":
+            indptr, indices = self.comm_indptr, self.comm_indices
+        else:
+            raise ValueError(f"Unknown graph {graph}, expected 'obs' or 'comm'")
+        row = env * self.num_agents + agent
+        return indices[indptr[row] : indptr[row + 1]]
+
+    def reset(self, num_envs, seed=None, positions=None):
+        """
+        Allocates the state of num_envs environments with randomized agent positions.
+        An (E, N, 2) array of positions can be given instead, e.g. to continue from the positions of nepiada environments.
+        Returns the (E, N, 2) agent positions and the graphs in infos.
+        """
+        if seed is not None:
+            self._rng = np.random.RandomState(seed)
+
+        self.num_envs = num_envs
+        self.num_moves = 0
+        if positions is None:
+            self.pos = self._rng.randint(
+                low=0, high=self.config.size, size=(num_envs, self.num_agents, 2)
+            ).astype(np.int32)
+        else:
+            self.pos = np.array(positions, dtype=np.int32)
+            assert self.pos.shape == (num_envs, self.num_agents, 2)
+
+        self._reset_graphs()
+        self._update_graphs()
+
+        self.prev_scores = self._compute_scores()
+
+        return self.pos.copy(), self._infos()
+
+    def step(self, actions):
+        """
+        Moves the agents of every environment according to an (E, N) array of actions.
+        Moves that would leave the grid are ignored, like nepiada.move_drones, and agents may occupy the same cell.
+
+        Returns the (E, N, 2) agent positions, the (E, N) rewards, terminations and truncations, and the graphs in infos.
+        """
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs, self.num_agents)
+        assert ((actions >= 0) & (actions < len(self.move_table))).all(), "Invalid action"
+
+        # Update drone positions
+        new_pos = self.pos + self.move_table[actions]
+        valid = ((new_pos >= 0) & (new_pos < self.config.size)).all(axis=-1)
+        self.pos = np.where(valid[..., None], new_pos, self.pos)
+
+        # Delta rewards with a timestep penalty, as in nepiada.get_rewards
+        curr_scores = self._compute_scores()
+        rewards = curr_scores - self.prev_scores
+        penalty = self.num_moves / self.config.iterations
+        rewards = np.where(rewards < 0, rewards * (1 + penalty), rewards * (1 - penalty))
+        self.prev_scores = curr_scores
+
+        self.num_moves += 1
+        terminations = np.zeros((self.num_envs, self.num_agents), dtype=bool)
+        truncations = np.full(
+            (self.num_envs, self.num_agents), self.num_moves >= self.config.iterations
+        )
+
+        # Update the observation and communication graphs at each iteration
+        self._update_graphs()
+
+        return self.pos.copy(), rewards, terminations, truncations, self._infos()
+
+    def _infos(self):
+        return {
+            "obs": (self.obs_indptr, self.obs_indices),
+            "comm": (self.comm_indptr, self.comm_indices),
+        }
@@ -0,0 +1,208 @@
+# This file implements the compiled kernels used to build the communication and observation graphs.
+# Every kernel takes the (N, 2) array of agent positions and returns the adjacency in CSR form:
+#     indptr:  int32[N + 1], the neighbours of agent i are stored in indices[indptr[i]:indptr[i + 1]]
+#     indices: int32[E], the index of each neighbour, in the row order of the positions array
+import numpy as np
+import numba
+
+
+@numba.njit(cache=True, boundscheck=False)
+def _squared_distance(pos, i, j):
+    dx = pos[j, 0] - pos[i, 0]
+    dy = pos[j, 1] - pos[i, 1]
+    return dx * dx + dy * dy
+
+
+@numba.njit(cache=True, boundscheck=False)
+def _count_within(pos, r2, counts):
+    """
+    Counts the number of agents strictly within the radius of every agent into counts.
+    Distance is symmetric, so each pair i < j is only tested once and counted for both agents.
+    """
+    n = pos.shape[0]
+    for i in range(n):
+        for j in range(i + 1, n):
+            if _squared_distance(pos, i, j) < r2:
+                counts[i] += 1
+                counts[j] += 1
+
+
+@numba.njit(cache=True, boundscheck=False)
+def _fill_within(pos, r2, indices, cursor):
+    """
+    Writes the agents strictly within the radius of every agent i into indices, starting at cursor[i].
+    Each pair i < j is only tested once and written to both rows. Row i receives all of its neighbours
+    j < i before any j > i, so every row ends up in increasing index order. cursor is advanced past the
+    written neighbours.
+    """
+    n = pos.shape[0]
+    for i in range(n):
+        for j in range(i + 1, n):
+            if _squared_distance(pos, i, j) < r2:
+                indices[cursor[i]] = j
+                cursor[i] += 1
+                indices[cursor[j]] = i
+                cursor[j] += 1
+
+
+@numba.njit(cache=True, boundscheck=False)
+def build_adj(pos, r2):
+    """
+    Builds the adjacency of every agent with all other agents that are strictly within the radius.
+
+    params:
+        pos: An (N, 2) integer array of agent positions
+        r2: The squared radius
+    """
+    n = pos.shape[0]
+
+    # First pass counts the number of neighbours per agent
+    counts = np.zeros(n, dtype=np.int32)
+    _count_within(pos, r2, counts)
+
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    for i in range(n):
+        indptr[i + 1] = indptr[i] + counts[i]
+
+    # Second pass fills in the neighbours
+    indices = np.empty(indptr[n], dtype=np.int32)
+    cursor = indptr[:n].copy()
+    _fill_within(pos, r2, indices, cursor)
+
+    return indptr, indices
+
+
+@numba.njit(cache=True, boundscheck=False)
+def _closest_outside(pos, i, r2, amount, out):
+    """
+    Writes the `amount` closest agents to agent i that are not within the radius into out, closest first.
+    Ties are broken by the agent index. Only the `amount` selected agents are sorted, the rest of the
+    candidates go through a partial selection instead of a full sort.
+    """
+    n = pos.shape[0]
+
+    # Squared distances to the agents outside the radius
+    cand_d2 = np.empty(n, dtype=pos.dtype)
+    cand_idx = np.empty(n, dtype=np.int32)
+    m = 0
+    for j in range(n):
+        if j == i:
+            continue
+        d2 = _squared_distance(pos, i, j)
+        if d2 >= r2:
+            cand_d2[m] = d2
+            cand_idx[m] = j
+            m += 1
+
+    # The amount-th smallest squared distance, found in linear time
+    kth = np.partition(cand_d2[:m], amount - 1)[amount - 1]
+
+    # Select every agent closer than it, then fill up with the agents at exactly that distance in index order
+    sel_d2 = np.empty(amount, dtype=pos.dtype)
+    sel_idx = np.empty(amount, dtype=np.int32)
+    k = 0
+    for c in range(m):
+        if cand_d2[c] < kth:
+            sel_d2[k] = cand_d2[c]
+            sel_idx[k] = cand_idx[c]
+            k += 1
+    for c in range(m):
+        if k == amount:
+            break
+        if cand_d2[c] == kth:
+            sel_d2[k] = cand_d2[c]
+            sel_idx[k] = cand_idx[c]
+            k += 1
+
+    # The selection is in index order, so a stable sort orders it by distance with ties broken by index
+    order = np.argsort(sel_d2, kind="mergesort")
+    for k in range(amount):
+        out[k] = sel_idx[order[k]]
+
+
+@numba.njit(cache=True, boundscheck=False)
+def build_adj_min(pos, r2, minimum):
+    """
+    Builds the adjacency of every agent with all other agents that are strictly within the radius.
+    If an agent has fewer than `minimum` neighbours, the closest agents outside the radius are
+    appended after the ones within the radius until the minimum is reached.
+
+    params:
+        pos: An (N, 2) integer array of agent positions
+        r2: The squared radius
+        minimum: The enforced minimum number of neighbours per agent
+    """
+    n = pos.shape[0]
+
+    # First pass counts the neighbours within the radius, plus the amount missing to reach the minimum
+    within = np.zeros(n, dtype=np.int32)
+    _count_within(pos, r2, within)
+
+    missing = np.zeros(n, dtype=np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    for i in range(n):
+        missing[i] = min(max(minimum - within[i], 0), n - 1 - within[i])
+        indptr[i + 1] = indptr[i] + within[i] + missing[i]
+
+    # Second pass fills in the neighbours within the radius, then the closest agents outside
+    # the radius are appended only to the agents below the minimum.
+    # The kernel is serial: the symmetric passes write to two rows per pair, and at the agent counts used
+    # here the threading overhead of a parallel row scan costs more than the work it would split up.
+    indices = np.empty(indptr[n], dtype=np.int32)
+    cursor = indptr[:n].copy()
+    _fill_within(pos, r2, indices, cursor)
+    for i in range(n):
+        if missing[i] > 0:
+            _closest_outside(pos, i, r2, missing[i], indices[cursor[i] : cursor[i] + missing[i]])
+
+    return indptr, indices
+
+
+@numba.njit(cache=True, parallel=True, boundscheck=False)
+def build_adj_min_batch(pos, r2, minimum):
+    """
+    Batched version of build_adj_min over a leading environment axis, each environment is processed in parallel.
+    The adjacency of all environments is returned as a single CSR over E * N rows, where the neighbours
+    of agent i in environment e are stored in indices[indptr[e * N + i]:indptr[e * N + i + 1]].
+
+    params:
+        pos: An (E, N, 2) integer array of agent positions
+        r2: The squared radius
+        minimum: The enforced minimum number of neighbours per agent, 0 disables the enforcement
+    """
+    num_envs = pos.shape[0]
+    n = pos.shape[1]
+
+    # First pass counts the neighbours within the radius, environments are independent
+    within = np.zeros((num_envs, n), dtype=np.int32)
+    for e in numba.prange(num_envs):
+        _count_within(pos[e], r2, within[e])
+
+    # The prefix sum over all rows is serial
+    missing = np.zeros((num_envs, n), dtype=np.int32)
+    indptr = np.zeros(num_envs * n + 1, dtype=np.int32)
+    for e in range(num_envs):
+        for i in range(n):
+            row = e * n + i
+            missing[e, i] = min(max(minimum - within[e, i], 0), n - 1 - within[e, i])
+            indptr[row + 1] = indptr[row] + within[e, i] + missing[e, i]
+
+    # Second pass fills in the neighbours, every environment writes to a disjoint slice of indices
+    indices = np.empty(indptr[num_envs * n], dtype=np.int32)
+    for e in numba.prange(num_envs):
+        env_pos = pos[e]
+        cursor = indptr[e * n : (e + 1) * n].copy()
+        _fill_within(env_pos, r2, indices, cursor)
+        for i in range(n):
+            if missing[e, i] > 0:
+                _closest_outside(env_pos, i, r2, missing[e, i], indices[cursor[i] : cursor[i] + missing[e, i]])
+
+    return indptr, indices
+
+
+@numba.njit(cache=True, boundscheck=False)
+def build_adj_batch(pos, r2):
+    """
+    Batched version of build_adj over a leading environment axis, see build_adj_min_batch for the layout.
+    """
+    return build_adj_min_batch(pos, r2, 0)
@@ -1,9 +1,15 @@
 # This file implements the communication and observation graphs inspired from Gadjov and Pavel et. al.
+import math
 import numpy as np
 import matplotlib.pyplot as plt
 import pygame
 from .anim_consts import *
 from utils.agent import AgentType
+from utils.graph_kernels import build_adj, build_adj_min
+
+# Used to rotate the arrow head vertices by 120 degrees
+_COS_120 = math.cos(math.radians(120))
+_SIN_120 = math.sin(math.radians(120))
 
 
 class Graph:
@@ -16,6 +22,11 @@ class Graph:
         self.dynamic_comms_radius = config.dynamic_comms_radius
         self.dynamic_comms_enforce_minimum = config.dynamic_comms_enforce_minimum
         self.observation_radius = config.obs_radius
+
+        # Distances are compared squared, so the radii are squared once here instead of taking a sqrt per pair
+        self._obs_r2 = self.observation_radius**2
+        self._comm_r2 = self.dynamic_comms_radius**2
+
         self.num_agents = config.num_good_agents + config.num_adversarial_agents
         self.obs_arrows = []
         self.screen = screen
@@ -24,59 +35,126 @@ class Graph:
         self.screen_width = config.screen_width
         self.screen_height = config.screen_height
 
+        # A stable mapping between agent names and the indices used by the graph kernels
+        self._idx_to_name = list(self.agents)
+        self._name_to_idx = {name: i for i, name in enumerate(self._idx_to_name)}
+        self._idx_to_name_array = np.array(self._idx_to_name)
+
+        # The (N, 2) array of agent positions, ordered as self._idx_to_name. This is the World's array, set on every update.
+        self.positions = None
+
+        # Both graphs are stored in CSR form, the neighbours of agent i are indices[indptr[i]:indptr[i + 1]].
+        # The adjacency lists keyed by agent name, self.obs and self.comm, are only built from these when accessed.
+        self._obs_dict = {agent: [] for agent in self.agents}
+
+        # Per agent numpy arrays of the observation graph returned by observe, cleared whenever the graph changes
+        self._obs_arrays = {}
+
         ## An adjacency list for which agent can communicate with each other
         if not self.dynamic_comms:
-            all_agents = [agent for agent in self.agents]
-            self.comm = {agent: all_agents for agent in self.agents}
+            # The static graph never changes, so it is built once here and shared across resets.
+            # Every agent shares the same list of neighbours, a list like the dynamic graph's adjacency lists.
+            n = len(self._idx_to_name)
+            self._static_comm_neighbours = list(self._idx_to_name)
+            self._comm_dict = dict.fromkeys(self._idx_to_name, self._static_comm_neighbours)
+            self._comm_stale = False
+
+            self.comm_indptr = np.arange(n + 1, dtype=np.int32) * n
+            self.comm_indices = np.tile(np.arange(n, dtype=np.int32), n)
+            self.comm_indptr.setflags(write=False)
+            self.comm_indices.setflags(write=False)
 
             print(
                 "Graphs INFO: Static Communication Graph Initialized | All agents can communicate with each other"
             )
         else:
-            self.comm = {agent: [] for agent in self.agents}
+            self._comm_dict = {agent: [] for agent in self.agents}
             print(
                 f"Graphs INFO: Dynamic Communication Graph Initialized | Communication Radius: {self.dynamic_comms_radius} units | Enforced minimum number of agents per communication: {self.dynamic_comms_enforce_minimum} agents"
             )
 
         # An adjacency list for which agent can observe each other
-        self.obs = {agent: [] for agent in self.agents}
         if self.dynamic_obs:
             print(
                 f"Graphs INFO: Dynamic Observation Graph Initialized | Observation Radius: {self.observation_radius} units"
             )
 
-    def _update_obs_graph(self, agents):
+        self.reset_graphs()
+
+    @property
+    def obs(self):
+        """
+        The observation graph as an adjacency list, where the key is the agent's name and the value is a list of the names of the agents it can observe.
+        """
+        if self._obs_stale:
+            self._csr_into_dict(self.obs_indptr, self.obs_indices, self._obs_dict)
+            self._obs_stale = False
+        return self._obs_dict
+
+    @property
+    def comm(self):
+        """
+        The communication graph as an adjacency list, where the key is the agent's name and the value is a list of the names of the agents it can communicate with.
+        """
+        if self._comm_stale:
+            self._csr_into_dict(self.comm_indptr, self.comm_indices, self._comm_dict)
+            self._comm_stale = False
+        return self._comm_dict
+
+    def obs_array(self, agent_name):
+        """
+        Returns the names of the agents that agent_name can observe as a read-only numpy array.
+        The array is built on first access and reused until the observation graph changes.
+        It is gathered from the CSR arrays, so neither the adjacency lists nor a list to array conversion are needed.
+        """
+        array = self._obs_arrays.get(agent_name)
+        if array is None:
+            array = self._idx_to_name_array[self.obs_neighbours(agent_name)]
+            array.setflags(write=False)
+            self._obs_arrays[agent_name] = array
+        return array
+
+    def obs_neighbours(self, agent_name):
+        """
+        Returns the indices of the agents that agent_name can observe, as a view into the CSR arrays.
+        """
+        i = self._name_to_idx[agent_name]
+        return self.obs_indices[self.obs_indptr[i] : self.obs_indptr[i + 1]]
+
+    def comm_neighbours(self, agent_name):
+        """
+        Returns the indices of the agents that agent_name can communicate with, as a view into the CSR arrays.
+        """
+        i = self._name_to_idx[agent_name]
+        return self.comm_indices[self.comm_indptr[i] : self.comm_indptr[i + 1]]
+
+    def _csr_into_dict(self, indptr, indices, adjacency):
+        """
+        Writes a CSR adjacency into the adjacency list used by the rest of the environment.
+        The lists are refilled in place so no new containers are allocated per update.
+        """
+        names = self._idx_to_name
+        for i, agent_name in enumerate(names):
+            adjacency[agent_name][:] = [names[j] for j in indices[indptr[i] : indptr[i + 1]]]
+
+    def _update_obs_graph(self, pos):
         """
         If dynamic observation graph is enabled, this function will update the observation graph based on the current positions of the agents.
         If static observation graph, this function will do nothing since the observation graph is already configured.
         
         params:
-            agents: A dictionary of agents, where the key is the agent's name and the value is the agent object.
+            pos: An (N, 2) array of agent positions, ordered as self._idx_to_name.
         """
         if self.dynamic_obs:
-            # Reset the graph
-            self.obs = {agent: [] for agent in agents}
-            for agent_name, agent in agents.items():
-                x_coord = agent.p_pos[0]
-                y_coord = agent.p_pos[1]
-
-                # Update observation graph here
-                for other_agent_name, other_agent in agents.items():
-                    if other_agent_name != agent_name:
-                        # Calculate the distance between them
-                        delta_x = other_agent.p_pos[0] - x_coord
-                        delta_y = other_agent.p_pos[1] - y_coord
-
-                        distance = np.sqrt(delta_x**2 + delta_y**2)
-
-                        # If within observation radius add them to the graph
-                        if distance < self.observation_radius:
-                            self.obs[agent_name].append(other_agent_name)
+            # If within observation radius add them to the graph
+            self.obs_indptr, self.obs_indices = build_adj(pos, self._obs_r2)
+            self._obs_stale = True
+            self._obs_arrays.clear()
         else:
             # Do not update the observation graph, because it has been configured to be static
             pass
 
-    def _update_comm_graph(self, agents):
+    def _update_comm_graph(self, pos):
         """
         If dynamic communication graph is enabled, this function will update the communication graph based on the current positions of the agents. 
         It will also enforce a minimum number of agents that can communicate with each other, if the number of agents that can communicate with each other
@@ -84,82 +162,64 @@ class Graph:
         If static communication graph, this function will do nothing since the communication graph is already configured to allow for full communication.
     
         params:
-            agents: A dictionary of agents, where the key is the agent's name and the value is the agent object.
+            pos: An (N, 2) array of agent positions, ordered as self._idx_to_name.
         """
         if self.dynamic_comms:
-            # Reset the graph
-            self.comm = {agent: [] for agent in agents}
-            for agent_name, agent in agents.items():
-                x_coord = agent.p_pos[0]
-                y_coord = agent.p_pos[1]
-
-                distances_to_agents_not_added = []
-                # Update communication graph here
-                for other_agent_name, other_agent in agents.items():
-                    if other_agent_name != agent_name:
-                        # Calculate the distance between them
-                        delta_x = other_agent.p_pos[0] - x_coord
-                        delta_y = other_agent.p_pos[1] - y_coord
-
-                        distance = np.sqrt(delta_x**2 + delta_y**2)
-
-                        # If within communication radius add them to the graph
-                        # If not within the communication radius, add them to a list of agents that are not added,
-                        # for potential future addition based on enforcing minimum number of comm agents.
-                        if distance < self.dynamic_comms_radius:
-                            self.comm[agent_name].append(other_agent_name)
-                        else:
-                            distances_to_agents_not_added.append(
-                                (distance, other_agent_name)
-                            )
-                if len(self.comm[agent_name]) < self.dynamic_comms_enforce_minimum:
-                    # Sort the distances to agents not added in ascending order
-                    distances_to_agents_not_added.sort(key=lambda x: x[0])
-
-                    amount_missing = self.dynamic_comms_enforce_minimum - len(
-                        self.comm[agent_name]
-                    )
-
-                    # Add the closest agents to the communication graph to reach minimum
-                    for _, other_agent_name in distances_to_agents_not_added[
-                        :amount_missing
-                    ]:
-                        self.comm[agent_name].append(other_agent_name)
+            # If within communication radius add them to the graph, then add the closest
+            # agents outside the radius to agents below the enforced minimum
+            self.comm_indptr, self.comm_indices = build_adj_min(
+                pos, self._comm_r2, self.dynamic_comms_enforce_minimum
+            )
+            self._comm_stale = True
         else:
             # Do not update the communication graph, because it has been configured to be static
             pass
 
-    def update_graphs(self, agents):
+    def update_graphs(self, agents, positions, moved=True):
+        """
+        Updates the graphs based on the current positions of the agents.
+
+        params:
+            agents: A dictionary of agents, where the key is the agent's name and the value is the agent object.
+            positions: An (N, 2) array of agent positions, ordered as the agents dictionary. It is passed to the graph kernels without a copy.
+            moved: Set to False if no agent has moved since the last update. The graphs only depend on the
+                   positions, so they are then left as they are, unless they were reset in the meantime.
+        """
         # Update the agents
         self.agents = agents
+        self.positions = positions
+
+        if not moved and not self._needs_update:
+            return
 
         # Update the observation graph
-        self._update_obs_graph(agents)
+        self._update_obs_graph(self.positions)
 
         # Update the communication graph
-        self._update_comm_graph(agents)
+        self._update_comm_graph(self.positions)
 
+        self._needs_update = False
         return
 
     def _draw_arrow(self, color, start, end, head_size=10):
         pygame.draw.line(self.screen, color, start, end, 1)
-        rotation = np.degrees(np.arctan2(start[1] - end[1], end[0] - start[0])) + 90
+        rotation = math.atan2(start[1] - end[1], end[0] - start[0]) + math.pi / 2
+        sin_r = math.sin(rotation)
+        cos_r = math.cos(rotation)
+
+        # The other two vertices of the arrow head are rotated by -120 and +120 degrees,
+        # expanded with the angle difference identities so only one sin and cos are needed
+        sin_minus = sin_r * _COS_120 - cos_r * _SIN_120
+        cos_minus = cos_r * _COS_120 + sin_r * _SIN_120
+        sin_plus = sin_r * _COS_120 + cos_r * _SIN_120
+        cos_plus = cos_r * _COS_120 - sin_r * _SIN_120
         pygame.draw.polygon(
             self.screen,
             color,
             (
-                (
-                    end[0] + head_size * np.sin(np.radians(rotation)),
-                    end[1] + head_size * np.cos(np.radians(rotation)),
-                ),
-                (
-                    end[0] + head_size * np.sin(np.radians(rotation - 120)),
-                    end[1] + head_size * np.cos(np.radians(rotation - 120)),
-                ),
-                (
-                    end[0] + head_size * np.sin(np.radians(rotation + 120)),
-                    end[1] + head_size * np.cos(np.radians(rotation + 120)),
-                ),
+                (end[0] + head_size * sin_r, end[1] + head_size * cos_r),
+                (end[0] + head_size * sin_minus, end[1] + head_size * cos_minus),
+                (end[0] + head_size * sin_plus, end[1] + head_size * cos_plus),
             ),
         )
 
@@ -256,25 +316,19 @@ class Graph:
         self._draw_global_arrangement_vector(self.global_arrangement_vector)
 
         # Draw the agents and the observations
-        observations = self.obs if type == "obs" else self.comm
-
-        for observer_name, observed_list in observations.items():
-            for observed_name in observed_list:
-                if observed_name in self.agents:
-                    observed = self.agents[observed_name]
-                    observer = self.agents[observer_name]
-                    observed_pixel_pos = (
-                        observed.p_pos[0] * self.cell_size + self.cell_size // 2,
-                        observed.p_pos[1] * self.cell_size + self.cell_size // 2,
-                    )
-                    observer_pixel_pos = (
-                        observer.p_pos[0] * self.cell_size + self.cell_size // 2,
-                        observer.p_pos[1] * self.cell_size + self.cell_size // 2,
-                    )
-
-                    self._draw_arrow(
-                        BLACK, observer_pixel_pos, observed_pixel_pos, head_size=5
-                    )
+        if type == "obs":
+            indptr, indices = self.obs_indptr, self.obs_indices
+        else:
+            indptr, indices = self.comm_indptr, self.comm_indices
+
+        # Pixel positions of every agent are computed once per frame and shared by all of its edges
+        pixel_pos = (self.positions * self.cell_size + self.cell_size // 2).tolist()
+
+        for observer in range(len(pixel_pos)):
+            for observed in indices[indptr[observer] : indptr[observer + 1]]:
+                self._draw_arrow(
+                    BLACK, pixel_pos[observer], pixel_pos[observed], head_size=5
+                )
 
         # Update the display
         pygame.display.flip()
@@ -287,10 +341,18 @@ class Graph:
         self.clock.tick(FPS)
 
     def reset_graphs(self):
-        if not self.dynamic_comms:
-            all_agents = [agent for agent in self.agents]
-            self.comm = {agent: all_agents for agent in self.agents}
-        else:
-            self.comm = {agent: [] for agent in self.agents}
+        n = len(self._idx_to_name)
+
+        # The static communication graph is left as built in __init__
+        if self.dynamic_comms:
+            self.comm_indptr = np.zeros(n + 1, dtype=np.int32)
+            self.comm_indices = np.zeros(0, dtype=np.int32)
+            self._comm_stale = True
+
+        self.obs_indptr = np.zeros(n + 1, dtype=np.int32)
+        self.obs_indices = np.zeros(0, dtype=np.int32)
+        self._obs_stale = True
+        self._obs_arrays.clear()
 
-        self.obs = {agent: [] for agent in self.agents}
+        # The next update must rebuild the graphs even if no agent moved
+        self._needs_update = True
@@ -5,6 +5,16 @@ from .agent import AgentType
 from collections import defaultdict
 
 
+def build_move_deltas(possible_moves):
+    """
+    Builds the lookup table from an action to its (dx, dy) move, where row a is the move of action a.
+    A whole vector of actions can then be mapped in a single indexing operation.
+    """
+    return np.array(
+        [possible_moves[action] for action in range(len(possible_moves))], dtype=np.int32
+    )
+
+
 class Grid:
     def __init__(self, config):
         self.dim = config.size
@@ -17,6 +27,9 @@ class Grid:
 
         self.uid_to_type = {}
 
+        # Lookup table from an action to its (dx, dy) move, built once from the possible moves
+        self.move_deltas = build_move_deltas(config.possible_moves)
+
         print("Grid INFO: Grid Initialized")
 
     def save_agent_types(self, agents):
@@ -38,41 +51,19 @@ class Grid:
             for y in range(self.dim):
                 self.state[x][y].add(self.config.empty_cell)
 
-    def move_drone(self, agent, action):
+    def place_drone(self, agent, new_x_coord, new_y_coord):
         """
-        Moves drone in corresponding direction, checks for validity of the move
+        Moves drone to a new position that is already known to be valid, and updates the grid
         """
-        # Get the current position of the agent
         x_coord = agent.p_pos[0]
         y_coord = agent.p_pos[1]
 
-        # Check if the move is to stay in the same position, if so just return
-        dx = self.config.possible_moves[action][0]
-        dy = self.config.possible_moves[action][1]
-
-        if dx == 0 and dy == 0:
-            return 0
-
-        # Get the new position of the agent
-        new_x_coord = x_coord + dx
-        new_y_coord = y_coord + dy
-
-        # Check if the new position is valid
-        if (
-            new_x_coord < 0
-            or new_x_coord >= self.dim
-            or new_y_coord < 0
-            or new_y_coord >= self.dim
-        ):
-            return -1
-
         # Update the grid
         self.state[x_coord][y_coord].remove(agent.uid)
         self.state[x_coord][y_coord].add(self.config.empty_cell)
 
         self.state[new_x_coord][new_y_coord].add(agent.uid)
 
-        # Update the agent position
-        agent.p_pos = np.array([new_x_coord, new_y_coord], dtype=np.float32)
-
-        return 0
+        # Update the agent position, in place since p_pos is a view into the world's positions
+        agent.p_pos[0] = new_x_coord
+        agent.p_pos[1] = new_y_coord
@@ -7,6 +7,41 @@ import numpy as np
 from .anim_consts import *
 
 
+def agent_name(i, config):
+    """
+    Returns the name of the i-th agent, adversarial agents are created first followed by truthful agents
+    """
+    if i < config.num_adversarial_agents:
+        return "adversarial_" + str(i)
+    return "truthful_" + str(i)
+
+
+def target_neighbours(i, width, height):
+    """
+    Returns the target neighbours of the i-th agent in a formation of the given width and height, as a list of
+    (neighbour index, ideal relative position) tuples. These are its left, right, top and bottom agents, if they exist.
+    """
+    neighbours = []
+
+    # Check the left
+    if i % width != 0:
+        neighbours.append((i - 1, [-1, 0]))
+
+    # Check the right
+    if (i + 1) % width != 0:
+        neighbours.append((i + 1, [1, 0]))
+
+    # Check the top
+    if i // width != 0:
+        neighbours.append((i - width, [0, 1]))
+
+    # Check the bottom
+    if i // width != height - 1:
+        neighbours.append((i + width, [0, -1]))
+
+    return neighbours
+
+
 class World:
     def __init__(self, config):
         # Check if the number of agents match the agents target size
@@ -21,6 +56,15 @@ class World:
             self.num_agents, config
         )
 
+        # The positions of all agents are stored in a single (N, 2) array, where row i is the i-th agent created by
+        # this world, i.e. self.agent_uid_to_name[i]. This is not agent.uid, which is a counter global to the process.
+        # Each agent's p_pos is a view of its row, so positions must be updated in place, e.g. p_pos[:] = new_pos
+        self.positions = np.zeros((self.num_agents, 2), dtype=np.int32)
+        for i in range(self.num_agents):
+            agent = self.agents[self.agent_uid_to_name[i]]
+            self.positions[i] = agent.p_pos
+            agent.p_pos = self.positions[i]
+
         # Set each agent's adjacent target neighbours
         self.__initialize_target_neighbours(self.num_agents, config)
         self.screen = self._init_pygame(config.screen_height, config.screen_width)
@@ -38,7 +82,7 @@ class World:
         self.grid.update_grid(self.agents)
 
         # Update the graphs with agent's position
-        self.graph.update_graphs(self.agents)
+        self.graph.update_graphs(self.agents, self.positions)
 
         # The target where all the drones want to reach
         self.target_x = config.size / 2
@@ -56,7 +100,10 @@ class World:
         return screen
 
     def __del__(self):
-        pygame.quit()
+        # The world may only be collected at interpreter shutdown, after pygame's module functions have been torn down
+        pygame_quit = getattr(pygame, "quit", None)
+        if callable(pygame_quit):
+            pygame_quit()
         print("World has been initialized")
 
     def __initialize_agents(self, num_agents, config):
@@ -74,16 +121,14 @@ class World:
         agent_uid_to_name = {}
         for i in range(num_agents):
             # Initialize the agent
-            agent_name = ""
+            name = agent_name(i, config)
             if i < config.num_adversarial_agents:
-                agent_name = "adversarial_" + str(i)
-                agents[agent_name] = Agent(AgentType.ADVERSARIAL)
+                agents[name] = Agent(AgentType.ADVERSARIAL)
             else:
-                agent_name = "truthful_" + str(i)
-                agents[agent_name] = Agent(AgentType.TRUTHFUL)
+                agents[name] = Agent(AgentType.TRUTHFUL)
 
             # Map the uid to agent name for later use
-            agent_uid_to_name[i] = agent_name
+            agent_uid_to_name[i] = name
 
         return agents, agent_uid_to_name
 
@@ -101,40 +146,17 @@ class World:
 
         for i in range(num_agents):
             # Get the agent
-            width = config.agent_grid_width
-            height = config.agent_grid_height
-            agent_name = self.agent_uid_to_name[i]
-            agent = self.agents[agent_name]
-
-            # Check the left
-            if i % width != 0:
-                # Add the target neighbour
-                neighbour_name = self.agent_uid_to_name[i - 1]
-                agent.set_target_neighbour(neighbour_name, [-1, 0])
-
-            # Check the right
-            if (i + 1) % width != 0:
-                # Add the target neighbour
-                neighbour_name = self.agent_uid_to_name[i + 1]
-                agent.set_target_neighbour(neighbour_name, [1, 0])
-
-            # Check the top
-            if i // width != 0:
-                # Add the target neighbour
-                neighbour_name = self.agent_uid_to_name[i - width]
-                agent.set_target_neighbour(neighbour_name, [0, 1])
-
-            # Check the bottom
-            if i // width != height - 1:
-                # Add the target neighbour
-                neighbour_name = self.agent_uid_to_name[i + width]
-                agent.set_target_neighbour(neighbour_name, [0, -1])
+            agent = self.agents[self.agent_uid_to_name[i]]
+
+            # Add the target neighbours
+            for neighbour, offset in target_neighbours(i, config.agent_grid_width, config.agent_grid_height):
+                agent.set_target_neighbour(self.agent_uid_to_name[neighbour], offset)
 
         return
 
-    def update_graphs(self):
-        # Update the graphs based on agent's true current position
-        self.graph.update_graphs(self.agents)
+    def update_graphs(self, moved=True):
+        # Update the graphs based on agent's true current position, this is skipped if no agent has moved
+        self.graph.update_graphs(self.agents, self.positions, moved=moved)
 
     def get_agent(self, agent_name):
         return self.agents[agent_name]
@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+import pytest
+
+from utils.graph_kernels import build_adj, build_adj_min, build_adj_batch, build_adj_min_batch
+
+
+def reference_adj(pos, radius, minimum=0):
+    """
+    The original python loops of Graph._update_obs_graph and Graph._update_comm_graph, with a minimum of 0
+    no agents outside the radius are added. Returns a list of neighbour indices per agent.
+    """
+    adj = []
+    for i in range(len(pos)):
+        within = []
+        not_added = []
+        for j in range(len(pos)):
+            if j == i:
+                continue
+            distance = math.sqrt((pos[j][0] - pos[i][0]) ** 2 + (pos[j][1] - pos[i][1]) ** 2)
+            if distance < radius:
+                within.append(j)
+            else:
+                not_added.append((distance, j))
+
+        if len(within) < minimum:
+            # The sort is stable, so agents at the same distance stay in index order
+            not_added.sort(key=lambda x: x[0])
+            within += [j for _, j in not_added[: minimum - len(within)]]
+        adj.append(within)
+    return adj
+
+
+def csr_rows(indptr, indices):
+    return [indices[indptr[i] : indptr[i + 1]].tolist() for i in range(len(indptr) - 1)]
+
+
+# Small grids put many agents at the same distance and on the same cell, which exercise the tie order
+CASES = [
+    (num_agents, size, radius, seed)
+    for num_agents in (1, 2, 6, 9, 25)
+    for size in (3, 20)
+    for radius in (0, 1, 4, 15)
+    for seed in range(5)
+]
+
+
+def random_positions(num_agents, size, seed, num_envs=None):
+    shape = (num_agents, 2) if num_envs is None else (num_envs, num_agents, 2)
+    return np.random.RandomState(seed).randint(0, size, size=shape).astype(np.int32)
+
+
+@pytest.mark.parametrize("num_agents, size, radius, seed", CASES)
+def test_build_adj(num_agents, size, radius, seed):
+    pos = random_positions(num_agents, size, seed)
+    indptr, indices = build_adj(pos, radius**2)
+    assert csr_rows(indptr, indices) == reference_adj(pos.tolist(), radius)
+
+
+@pytest.mark.parametrize("num_agents, size, radius, seed", CASES)
+@pytest.mark.parametrize("minimum", (1, 3, 8, 30))
+def test_build_adj_min(num_agents, size, radius, seed, minimum):
+    # A minimum above N - 1 is capped at the number of other agents
+    pos = random_positions(num_agents, size, seed)
+    indptr, indices = build_adj_min(pos, radius**2, minimum)
+    assert csr_rows(indptr, indices) == reference_adj(pos.tolist(), radius, minimum)
+
+
+@pytest.mark.parametrize("num_agents, size, radius, seed", CASES)
+@pytest.mark.parametrize("minimum", (0, 3, 30))
+def test_build_adj_batch(num_agents, size, radius, seed, minimum):
+    num_envs = 4
+    pos = random_positions(num_agents, size, seed, num_envs)
+
+    if minimum == 0:
+        indptr, indices = build_adj_batch(pos, radius**2)
+    else:
+        indptr, indices = build_adj_min_batch(pos, radius**2, minimum)
+
+    rows = csr_rows(indptr, indices)
+    for e in range(num_envs):
+        expected = reference_adj(pos[e].tolist(), radius, minimum)
+        assert rows[e * num_agents : (e + 1) * num_agents] == expected
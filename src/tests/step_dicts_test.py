@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import env.nepiada as nepiada
+from utils.config import Config
+
+
+def test_step_dicts_are_reused():
+    """
+    The raw env allocates rewards, terminations and truncations once in reset and overwrites them in place at every step,
+    so a caller that keeps them across steps must copy them.
+    """
+    env = nepiada.raw_env(config=Config())
+    env.reset(seed=0)
+    rng = np.random.RandomState(0)
+
+    _, rewards, terminations, truncations, _ = env.step({agent: int(rng.randint(5)) for agent in env.agents})
+    recorded_rewards = dict(rewards)
+
+    _, next_rewards, next_terminations, next_truncations, _ = env.step(
+        {agent: int(rng.randint(5)) for agent in env.agents}
+    )
+
+    assert rewards is next_rewards
+    assert terminations is next_terminations
+    assert truncations is next_truncations
+
+    # The dictionary from the first step now holds the second step's values, the copy keeps the first
+    assert rewards == next_rewards
+    assert recorded_rewards != next_rewards
+
+
+@pytest.mark.parametrize("dynamic_comms", (False, True))
+def test_infos_are_updated_in_place(dynamic_comms):
+    """
+    The per agent info dicts are also allocated once in reset. Each step refills their obs and comm adjacency lists,
+    which are lists for both the static and the dynamic graphs.
+    """
+    config = Config()
+    config.dynamic_comms = dynamic_comms
+    env = nepiada.raw_env(config=config)
+    _, infos = env.reset(seed=0)
+    info = infos[env.agents[0]]
+    rng = np.random.RandomState(0)
+
+    for _ in range(3):
+        _, _, _, _, infos = env.step({agent: int(rng.randint(5)) for agent in env.agents})
+        assert infos[env.agents[0]] is info
+
+        graph = env.world.graph
+        for agent in env.agents:
+            assert isinstance(infos[agent]["obs"], list)
+            assert isinstance(infos[agent]["comm"], list)
+            assert infos[agent]["obs"] == [env.agents[j] for j in graph.obs_neighbours(agent)]
+            assert infos[agent]["comm"] == [env.agents[j] for j in graph.comm_neighbours(agent)]
+            assert infos[agent]["agent_instance"] is env.world.get_agent(agent)
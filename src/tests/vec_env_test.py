@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+import pytest
+
+import env.nepiada as nepiada
+from env.nepiada_vec import VectorEnv
+from utils.config import Config
+
+
+def reference_scores(pos, config):
+    """
+    The formula of nepiada._compute_scores computed with python scalars for a single environment, where the
+    target neighbours of each agent are its left, right, top and bottom agents in the formation, as in World.
+    """
+    width = config.agent_grid_width
+    height = config.agent_grid_height
+    target = config.size / 2
+
+    scores = []
+    for i, (x, y) in enumerate(pos):
+        target_neighbours = []
+        if i % width != 0:
+            target_neighbours.append((i - 1, (-1, 0)))
+        if (i + 1) % width != 0:
+            target_neighbours.append((i + 1, (1, 0)))
+        if i // width != 0:
+            target_neighbours.append((i - width, (0, 1)))
+        if i // width != height - 1:
+            target_neighbours.append((i + width, (0, -1)))
+
+        deviation_from_global_arrangement = math.sqrt((x - target) ** 2 + (target - y) ** 2)
+        deviation_from_arrangement = 0
+        for neighbour, (ideal_x, ideal_y) in target_neighbours:
+            dx = pos[neighbour][0] - x - ideal_x
+            dy = pos[neighbour][1] - y - ideal_y
+            deviation_from_arrangement += math.sqrt(dx * dx + dy * dy)
+        deviation_from_arrangement /= len(target_neighbours)
+
+        scores.append(
+            -(
+                (config.global_reward_weight * deviation_from_global_arrangement)
+                + (config.local_reward_weight * deviation_from_arrangement)
+            )
+        )
+    return scores
+
+
+def test_vec_env_rewards():
+    config = Config()
+    env = VectorEnv(config)
+    rng = np.random.RandomState(0)
+
+    pos, _ = env.reset(num_envs=8, seed=0)
+    prev_scores = [reference_scores(p.tolist(), config) for p in pos]
+
+    for num_moves in range(config.iterations):
+        actions = rng.randint(0, len(config.possible_moves), size=(env.num_envs, env.num_agents))
+        pos, rewards, _, truncations, _ = env.step(actions)
+
+        for e in range(env.num_envs):
+            curr_scores = reference_scores(pos[e].tolist(), config)
+            for i in range(env.num_agents):
+                # Delta reward with the timestep penalty of nepiada.get_rewards
+                reward = curr_scores[i] - prev_scores[e][i]
+                if reward < 0:
+                    reward += (num_moves / config.iterations) * reward
+                elif reward > 0:
+                    reward -= (num_moves / config.iterations) * reward
+                assert math.isclose(rewards[e, i], reward, rel_tol=1e-4, abs_tol=1e-4)
+            prev_scores[e] = curr_scores
+
+    assert truncations.all()
+
+
+@pytest.mark.parametrize("dynamic_comms", (False, True))
+def test_vec_env_matches_nepiada(dynamic_comms):
+    """
+    Steps a VectorEnv from the positions of a nepiada environment with the same actions, and compares the moves,
+    the observation and communication graphs, and the rewards with nepiada after every step.
+    """
+    config = Config()
+    config.dynamic_obs = True
+    config.obs_radius = 8
+    config.dynamic_comms = dynamic_comms
+
+    env = nepiada.parallel_env(config=config)
+    env.reset(seed=0)
+    world = env.unwrapped.world
+
+    vec_env = VectorEnv(config)
+    assert vec_env.possible_agents == env.agents
+    vec_env.reset(num_envs=1, positions=world.positions[None])
+
+    rng = np.random.RandomState(0)
+    for _ in range(5):
+        actions = rng.randint(0, len(config.possible_moves), size=(1, vec_env.num_agents))
+        _, rewards, _, _, _ = env.step({agent: int(actions[0, i]) for i, agent in enumerate(env.agents)})
+        pos, vec_rewards, _, _, _ = vec_env.step(actions)
+
+        assert np.array_equal(pos[0], world.positions)
+        for i, agent in enumerate(vec_env.possible_agents):
+            assert np.array_equal(vec_env.neighbours(0, i, "obs"), world.graph.obs_neighbours(agent))
+            assert np.array_equal(vec_env.neighbours(0, i, "comm"), world.graph.comm_neighbours(agent))
+            assert math.isclose(vec_rewards[0, i], rewards[agent], rel_tol=1e-4, abs_tol=1e-4)
+
+
+def test_vec_env_neighbours_rejects_unknown_graph():
+    env = VectorEnv(Config())
+    env.reset(num_envs=1, seed=0)
+    with pytest.raises(ValueError):
+        env.neighbours(0, 0, graph="com")